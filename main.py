@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
-import os, re, json, html, random, hashlib
+import os, re, json, html, math, random, hashlib
+from collections import Counter
 from datetime import datetime, date, timedelta
 from zoneinfo import ZoneInfo
 from urllib.parse import quote_plus
@@ -158,6 +159,7 @@ TITLE_WINDOW        = int(os.getenv("TITLE_WINDOW","40"))
 TOPIC_WINDOW_DAYS   = int(os.getenv("TOPIC_WINDOW_DAYS","14"))
 HISTORY_TITLES_FILE = "posted_titles.jsonl"
 HISTORY_TOPICS_FILE = "used_topics.jsonl"
+KEYWORD_DF_FILE     = "keyword_df.json"   # تكرار الكلمات عبر المقالات السابقة (لـ TF-IDF)، يحفظه actions/cache في الـ workflow
 
 # =================== سياسة اختيار المواضيع ===================
 _TOPIC_POLICY = os.getenv("TOPIC_POLICY", "")
@@ -517,45 +519,141 @@ def fetch_img_free(topic, seed: str):
             return {"url": ok.url, "credit": "Free image source"}
     return None
 
-def extract_keywords_ar(*texts, k=4):
-    txt = " ".join([t or "" for t in texts])
-    words = re.findall(r"[A-Za-z\u0600-\u06FF]{3,}", txt)
-    _AR_STOP = set("من في على عن إلى الى و أو ثم كما حيث بما أن إن كان هذه هذا ذلك التي الذين إذا إذ قد سوف مع لدى بين خلال ضد نحو دون غير فوق تحت حول عبر حتى جدا كثيرًا كثيرا بدون".split())
-    clean=[]
-    for w in words:
-        w2=w.strip().lower()
-        if w2 in _AR_STOP: continue
-        if w2 not in clean: clean.append(w2)
-    return " ".join(clean[:k]) or "abstract"
-
-def pick_image(topic_or_title: str, slot_idx: int = 0, article_text: str = "") -> dict:
-    q = extract_keywords_ar(topic_or_title, article_text, k=5)
-    base_topic = (topic_or_title or "").split("،")[0].split(":")[0].strip() or "abstract"
-    seed  = f"{base_topic}|{q}|{slot_idx}|{datetime.now(TZ).date().isoformat()}"
-
-    # 0) صورة مفروضة؟
-    if FORCED_IMAGE and not _image_is_forbidden(FORCED_IMAGE):
-        return {"url": _ensure_https(FORCED_IMAGE), "credit": "Featured image"}
-
-    candidates = []
+# ======= كلمات مفتاحية (TF-IDF) لاستعلامات الصور =======
+_WORD_RE    = re.compile(r"[A-Za-z0-9]+|[\u0621-\u0652\u0640]+")
+_MD_LINK_RE = re.compile(r"!?\[[^\]]*\]\([^)]*\)")
+_URL_RE     = re.compile(r"https?://\S+")
+_REFS_RE    = re.compile(r"^\s*#+\s*(?:المراجع|المصادر|references|sources)\s*$", re.M | re.I)
+_DF_PRUNE_EVERY = 100   # كل 100 مقال تُحذف الكلمات ذات df == 1
+_EN_MIN_TF  = 2   # كلمة إنجليزية تظهر مرة واحدة في مقال عربي لا تصلح استعلامًا
+_AR_DIACRITICS = str.maketrans("", "", "\u0640\u064B\u064C\u064D\u064E\u064F\u0650\u0651\u0652")
+
+def _norm_word(w: str) -> str:
+    return w.strip().lower().translate(_AR_DIACRITICS)
+
+_AR_STOP = frozenset(_norm_word(w) for w in """
+من في على عن إلى الى و أو ثم كما حيث بما أن إن كان كانت يكون تكون هذه هذا ذلك تلك التي الذي الذين إذا إذ قد سوف مع لدى بين خلال ضد نحو دون غير فوق تحت حول عبر حتى جدا كثيرًا كثيرا بدون
+لكن ليس لها لهم منها منه فيها فيه عليها عليه إلى أي كل بعض عند عندما بعد قبل أيضا أيضًا يمكن مثل هناك هنا وهو وهي هو هي نحن هم التى وفي ومن وعلى والتي الذي أكثر أقل ضمن لذلك بذلك المراجع المصدر
+""".split())
+_EN_STOP = frozenset("""
+the and for with that this from are was were will can has have had not but its into than then them they their there these those which what when where who how why about over also more most such only other some any each our your you out all may use using used new
+https http www com org html references source
+""".split())
+
+def _load_keyword_df() -> dict:
+    """يقرأ ملف DF؛ غيابه = أرشيف فارغ، أما تلفه أو شكله الخاطئ فيرفع ValueError."""
+    try:
+        with open(KEYWORD_DF_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {"docs": 0, "df": {}}
+    docs = data.get("docs", 0) if isinstance(data, dict) else None
+    df   = data.get("df", {}) if isinstance(data, dict) else None
+    if not (isinstance(docs, int) and not isinstance(docs, bool) and docs >= 0
+            and isinstance(df, dict)
+            and all(isinstance(t, str) and isinstance(n, int) and not isinstance(n, bool)
+                    for t, n in df.items())):
+        raise ValueError("unexpected keyword DF shape")
+    return {"docs": docs, "df": df}
+
+def _body_text(article_md: str) -> str:
+    """نص المقال فقط: بلا قسم المراجع ولا الروابط التي تضيفها ensure_refs/linkify."""
+    txt = article_md or ""
+    m = _REFS_RE.search(txt)
+    if m: txt = txt[:m.start()]
+    txt = _MD_LINK_RE.sub(" ", txt)
+    return _URL_RE.sub(" ", txt)
+
+def _tokenize(txt: str):
+    """يقسم النص إلى (كلمات عربية، كلمات إنجليزية) بعد حذف كلمات التوقف."""
+    ar, en = [], []
+    for w in _WORD_RE.findall(_body_text(txt)):
+        w2 = _norm_word(w)
+        if w2.isascii():
+            # اختصارات من حرفين مثل AI و 5G و 3D مقبولة، والأرقام وحدها لا
+            if w2.isdigit() or len(w2) < (2 if w.isupper() else 3): continue
+            if w2 not in _EN_STOP: en.append(w2)
+        elif len(w2) >= 3 and w2 not in _AR_STOP:
+            ar.append(w2)
+    return ar, en
+
+def _top_tfidf(tokens, df: dict, docs: int, k: int, min_tf: int = 1):
+    tf = Counter(tokens)
+    if min_tf > 1:
+        tf = Counter({t: n for t, n in tf.items() if n >= min_tf})
+    # sorted مستقر: عند التعادل تبقى الكلمة الأسبق ظهورًا أولًا
+    return sorted(tf, key=lambda t: tf[t] * (math.log((1 + docs) / (1 + df.get(t, 0))) + 1.0),
+                  reverse=True)[:k]
+
+def extract_keywords(*texts, k=4, corpus=None) -> dict:
+    """أهم k كلمات بالعربية والإنجليزية حسب TF-IDF مقابل أرشيف مقالاتنا السابقة."""
+    if corpus is None:
+        try:
+            corpus = _load_keyword_df()
+        except Exception as e:
+            print(f"WARN: {KEYWORD_DF_FILE} غير صالح ({e})؛ الترتيب بتكرار الكلمات فقط")
+            corpus = {"docs": 0, "df": {}}
+    ar, en = _tokenize(" ".join([t or "" for t in texts]))
+    docs, df = corpus["docs"], corpus["df"]
+    return {"ar": _top_tfidf(ar, df, docs, k), "en": _top_tfidf(en, df, docs, k, min_tf=_EN_MIN_TF)}
+
+def record_keywords(*texts):
+    """يحدّث تكرار الكلمات (DF) تدريجيًا بعد كل نشر؛ لا يُفشل التشغيل أبدًا."""
+    try:
+        _record_keywords(*texts)
+    except Exception as e:
+        print(f"WARN: تعذّر تحديث {KEYWORD_DF_FILE}: {e}")
 
-    # Wikipedia
-    for key in (base_topic, q):
-        img = fetch_image_general(key)
-        if img: candidates.append(img)
+def _record_keywords(*texts):
+    ar, en = _tokenize(" ".join([t or "" for t in texts]))
+    try:
+        corpus = _load_keyword_df()
+    except ValueError as e:
+        # الملف يعيش في actions/cache ولا يمكن إصلاحه يدويًا: انقله جانبًا وابدأ أرشيفًا جديدًا
+        print(f"WARN: {KEYWORD_DF_FILE} غير صالح ({e})؛ نُقل إلى {KEYWORD_DF_FILE}.bad")
+        os.replace(KEYWORD_DF_FILE, KEYWORD_DF_FILE + ".bad")
+        corpus = {"docs": 0, "df": {}}
+    df = corpus["df"]
+    for t in set(ar) | set(en):
+        df[t] = df.get(t, 0) + 1
+    corpus["docs"] += 1
+    # تقليم دوري للكلمات التي لم تتكرر في أي مقال آخر، كي يبقى الملف (والكاش) صغيرًا
+    if corpus["docs"] % _DF_PRUNE_EVERY == 0:
+        corpus["df"] = {t: n for t, n in df.items() if n > 1}
+    # كتابة ذرّية: ملف مؤقت ثم os.replace، فلا يبقى ملف نصف مكتوب
+    tmp = KEYWORD_DF_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(corpus, f, ensure_ascii=False)
+    os.replace(tmp, KEYWORD_DF_FILE)
+
+def _image_candidates(base_topic: str, queries, seed: str):
+    """يولّد المرشحين بالترتيب وعند الطلب فقط، فلا يُستدعى مزوّد تالٍ إلا إذا رُفض ما قبله."""
+    # Wikipedia: عناوين الصفحات لا تطابق كيسًا من الكلمات، فالموضوع وحده يكفي
+    yield fetch_image_general(base_topic)
 
     # APIs (Pexels / Pixabay / Unsplash)
-    for key in (q, base_topic):
+    for key in (*queries, base_topic):
         for fn in (fetch_img_pexels, fetch_img_pixabay, fetch_img_unsplash_api):
-            img = fn(key)
-            if img: candidates.append(img)
+            yield fn(key)
 
     # مصادر حرّة
-    free = fetch_img_free(q or base_topic, seed)
-    if free: candidates.append(free)
+    yield fetch_img_free(queries[0] if queries else base_topic, seed)
+
+def pick_image(topic_or_title: str, slot_idx: int = 0, article_text: str = "") -> dict:
+    # 0) صورة مفروضة؟
+    if FORCED_IMAGE and not _image_is_forbidden(FORCED_IMAGE):
+        return {"url": _ensure_https(FORCED_IMAGE), "credit": "Featured image"}
+
+    kw = extract_keywords(topic_or_title, article_text, k=5)
+    q_ar = " ".join(kw["ar"])
+    # الإنجليزية أولًا فقط إن كانت مصطلحات متكررة في نص المقال نفسه (انظر _EN_MIN_TF)
+    q_en = " ".join(kw["en"][:3])
+    queries = [q for q in dict.fromkeys((q_en, q_ar)) if q]
+    base_topic = (topic_or_title or "").split("،")[0].split(":")[0].strip() or "abstract"
+    seed  = f"{base_topic}|{q_ar or q_en}|{slot_idx}|{datetime.now(TZ).date().isoformat()}"
 
     # اختر أول صورة ليس لها هاش مستخدم سابقًا
-    for cand in candidates:
+    for cand in _image_candidates(base_topic, queries, seed):
         url = _ensure_https((cand or {}).get("url",""))
         if not url: continue
         h = _img_hash(url)
@@ -651,6 +749,7 @@ def make_article_once(slot: int = 0):
     res    = post_or_update(title, html_content, labels=labels,
                             topic_key_label=(k_label if ADD_TECH_LABELS else None),
                             image_hash_label=(i_label if ADD_TECH_LABELS else None))
+    record_keywords(title, article_md)
     state  = "مسودة" if PUBLISH_MODE != "live" else "منشور حي"
     print(f"[{datetime.now(TZ)}] {state}: {res.get('url','(بدون رابط)')} | {category} | {title}")
 